@@ -3,11 +3,11 @@
 #
 # Usage: python batch_rename.py <data.csv> <directory>
 
-import os, glob
+import os
 import csv
-from types import NoneType
+from functools import lru_cache
 from typing import TypedDict, List
-import dateparser
+from dateparser.date import DateDataParser
 import argparse
 
 def dir_path(string):
@@ -22,6 +22,22 @@ def csv_path(string):
     else:
         raise FileNotFoundError(string)
 
+# Reuse a single parser, building one per call is what makes dateparser.parse slow
+dateDataParser = DateDataParser(languages=['pt'])
+
+# The same dates repeat across many rows, so only parse each one once
+@lru_cache(maxsize=None)
+def parse_date(string):
+    tempDate = dateDataParser.get_date_data(string).date_obj
+
+    if tempDate is None:
+        return string
+
+    return tempDate.strftime("%m-%d")
+
+# Characters that can't be used in file names
+conteudoTable = str.maketrans({"/": "-", ":": " -"})
+
 parser = argparse.ArgumentParser()
 parser.add_argument('csvpath', type=csv_path)
 parser.add_argument('directorypath', type=dir_path)
@@ -32,58 +48,58 @@ class RowData(TypedDict):
     frente: str
     conteudo: str
 
-args = parser.parse_args()
+def main():
+    args = parser.parse_args()
 
-csvpath = args.csvpath
-directory = args.directorypath
-absolutedirectory = os.path.abspath(directory)
+    csvpath = args.csvpath
+    directory = args.directorypath
+    absolutedirectory = os.path.abspath(directory)
 
-# Get the number of files in the directory
-num_files = len(glob.glob(f"{absolutedirectory}/[!.]*.mp4"))
+    # Get the .mp4 files in the directory, reading it only once
+    with os.scandir(absolutedirectory) as entries:
+        filenames = sorted(entry.name for entry in entries if not entry.name.startswith('.') and entry.name.endswith('.mp4'))
 
-# Open the CSV file
-csvfile = open(csvpath, "r")
+    num_files = len(filenames)
 
-csvreader = csv.reader(csvfile,delimiter=';')
-next(csvreader)
+    row_count = 0
 
+    data: List[RowData] = []
 
-row_count = 0
+    # Open the CSV file
+    with open(csvpath, "r") as csvfile:
+        csvreader = csv.reader(csvfile,delimiter=';')
+        next(csvreader)
 
+        for i, line in enumerate(csvreader):
+            tempRow: RowData = {}
 
-data: List[RowData] = []
-for i, line in enumerate(csvreader):
-    tempRow: RowData = {}
+            tempRow['date'] = parse_date(line[0])
 
-    tempDate= dateparser.parse(line[0], languages=['pt'])
-
-    if type(tempDate) is NoneType:
-        tempRow['date'] = line[0]
-    else:
-        tempRow['date'] = tempDate.strftime("%m-%d")
+            tempRow['disciplina'] = line[2]
+            tempRow['frente'] = line[3]
+            tempRow['conteudo'] = line[4].translate(conteudoTable)
+            row_count += 1
 
-    tempRow['disciplina'] = line[2]
-    tempRow['frente'] = line[3]
-    tempRow['conteudo'] = line[4].replace("/", "-").replace(":", " -")
-    row_count += 1
+            data.append(tempRow)
 
-    data.append(tempRow)
+    i = 0
+    j = False
+    lado = "esq"
 
-i = 0
-j = False
-lado = "esq"
+    if num_files != row_count * 2:
+        raise Exception("Number of files in the directory and number of rows in the CSV file are not equal")
 
-if num_files != row_count * 2:
-    raise Exception("Number of files in the directory and number of rows in the CSV file are not equal")
+    for filename in filenames:
+        info = data[i]
+        os.rename(f"{absolutedirectory}/{filename}", f"{absolutedirectory}/{info['disciplina']} - {info['frente']} - {info['date']} - {info['conteudo']} - {lado}.mp4") 
 
-for filename in sorted(glob.glob(f"{absolutedirectory}/[!.]*.mp4")):
-    info = data[i]
-    os.rename(filename, f"{absolutedirectory}/{info['disciplina']} - {info['frente']} - {info['date']} - {info['conteudo']} - {lado}.mp4") 
+        if j == False:
+            lado= "dir"
+            j = True
+        elif j == True:
+            lado="esq"
+            i += 1
+            j = False
 
-    if j == False:
-        lado= "dir"
-        j = True
-    elif j == True:
-        lado="esq"
-        i += 1
-        j = False
\ No newline at end of file
+if __name__ == "__main__":
+    main()
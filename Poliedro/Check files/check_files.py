@@ -3,15 +3,27 @@
 #
 # Usage: python check_files.py <data.csv> <directory>
 
-import os, glob
+import os
+import sys
+import shutil
+import ctypes
+import fcntl
 import csv
-from types import NoneType
-from typing import TypedDict, List
-import dateparser
+import operator
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+from typing import NamedTuple
+from dateparser.date import DateDataParser
 import argparse
 import re
-from natsort import natsorted
-from unidecode import unidecode
+
+# anyascii transliterates with a faster table lookup, fall back to unidecode if it isn't installed
+try:
+    from anyascii import anyascii as unidecode
+except ImportError:
+    from unidecode import unidecode
 
 def dir_path(string):
     if os.path.isdir(string):
@@ -25,11 +37,108 @@ def csv_path(string):
     else:
         raise FileNotFoundError(string)
 
+# Reuse a single parser, building one per call is what makes dateparser.parse slow
+dateDataParser = DateDataParser(languages=['pt'])
+
+# Formats the CSV is known to use, tried before falling back to dateparser
+dateFormats = ("%d/%m/%Y", "%Y-%m-%d", "%d-%m-%Y", "%m/%d/%Y")
+
+# pt_BR dd/mmm, as in the example input.csv
+shortDateExpression = re.compile(r"(\d{1,2})/([a-z]{3})\.?")
+
+portugueseMonths = {"jan": 1, "fev": 2, "mar": 3, "abr": 4, "mai": 5, "jun": 6, "jul": 7, "ago": 8, "set": 9, "out": 10, "nov": 11, "dez": 12}
+
+def strptime_date(string):
+    string = string.strip()
+
+    for dateFormat in dateFormats:
+        try:
+            return datetime.strptime(string, dateFormat)
+        except ValueError:
+            pass
+
+    match = shortDateExpression.fullmatch(string.lower())
+
+    if match and match.group(2) in portugueseMonths:
+        try:
+            # Same as dateparser, dates without a year are in the current one
+            return datetime(datetime.now().year, portugueseMonths[match.group(2)], int(match.group(1)))
+        except ValueError:
+            pass
+
+    return None
+
+# The same dates repeat across many rows, so only parse each one once
+@lru_cache(maxsize=None)
+def parse_date(string):
+    tempDate = strptime_date(string)
+
+    if tempDate is None:
+        tempDate = dateDataParser.get_date_data(string).date_obj
+
+    if tempDate is None:
+        return string
+
+    return f"{tempDate.month:02d}-{tempDate.day:02d}"
+
+# ioctl request to clone a file on copy-on-write filesystems (btrfs, XFS)
+FICLONE = getattr(fcntl, "FICLONE", 0x40049409)
+
+if sys.platform == "darwin":
+    libc = ctypes.CDLL("libc.dylib", use_errno=True)
+
+# Clone files instead of copying their contents when the filesystem supports it,
+# like cp -c does on APFS, falling back to a regular copy
+def clone_file(src, dst):
+    if sys.platform == "darwin":
+        if libc.clonefile(os.fsencode(src), os.fsencode(dst), 0) == 0:
+            return dst
+    else:
+        try:
+            with open(src, "rb") as srcFile, open(dst, "wb") as dstFile:
+                fcntl.ioctl(dstFile.fileno(), FICLONE, srcFile.fileno())
+            shutil.copystat(src, dst)
+            return dst
+        except OSError:
+            pass
+
+    return shutil.copy2(src, dst)
+
+# disciplina and frente repeat on almost every row, only transliterate each value once
+cachedUnidecode = lru_cache(maxsize=None)(unidecode)
+
+# Matches the mm-dd date in a file name
+fileDateExpression = re.compile(r" - (\d{2})-(\d{2}) - ")
+
+# Sort files by date, then by name, the same order the rows are checked in
+def file_sort_key(entry):
+    match = fileDateExpression.search(entry.name)
+
+    if match:
+        return (match.group(1), match.group(2), entry.name)
+
+    return (entry.name,)
+
+# Report a file whose name doesn't match the one expected for its row
+def check_file(entry, expectedPrefix):
+    shortFilename = unidecode(entry.name)
+
+    if not (shortFilename.startswith(expectedPrefix) and os.path.splitext(shortFilename[len(expectedPrefix):])[0] in ("esq", "dir")):
+        return [f"   Found: {shortFilename}", f"Expected: {expectedPrefix}esq|dir\n"]
+
+    return []
+
+# Characters that can't be used in file names
+conteudoTable = str.maketrans({"/": "-", ":": " -"})
+
+# Matches the frente between the first pair of dashes in a file name
+dashExpression = re.compile(r"\-(.*?)\-")
+
 parser = argparse.ArgumentParser()
 parser.add_argument('csvpath', type=csv_path)
 parser.add_argument('directorypath', type=dir_path)
 
-class RowData(TypedDict):
+class RowData(NamedTuple):
     date: str
     disciplina: str
     frente: str
@@ -41,103 +150,82 @@ csvpath = args.csvpath
 directory = args.directorypath
 workingDirectory = os.path.abspath(directory)
 
+copyDirectory = f"{workingDirectory}/../{os.path.basename(workingDirectory)}_copy"
+
 # Duplicate directory
-if os.path.exists(f"{workingDirectory}/../{os.path.basename(workingDirectory)}_copy"):
+if os.path.exists(copyDirectory):
     raise Exception("Directory already exists")
-else:
-    os.mkdir(f"{workingDirectory}/../{os.path.basename(workingDirectory)}_copy")
 
 # Copy files to $PWD/../directory_copy
-os.system(f'cp -c -r "{workingDirectory}/"* "{workingDirectory}/../{os.path.basename(workingDirectory)}_copy"')
+shutil.copytree(workingDirectory, copyDirectory, copy_function=clone_file, ignore=shutil.ignore_patterns(".*"))
 
 # Set the new directory as the current directory
-workingDirectory = f"{workingDirectory}/../{os.path.basename(workingDirectory)}_copy"
+workingDirectory = copyDirectory
 
-# Get the number of files in the directory
-num_files = len(glob.glob(f"{workingDirectory}/[!.]*"))
+parsedDataset = defaultdict(list)
 
-# Open the CSV file
-csvfile = open(csvpath, "r")
+# Open the CSV file, with a large buffer so big files take fewer reads
+with open(csvpath, "r", buffering=1 << 20, newline="") as csvfile:
+    csvreader = csv.reader(csvfile,delimiter=';')
+    next(csvreader)
 
-csvreader = csv.reader(csvfile,delimiter=';')
-next(csvreader)
+    for line in csvreader:
+        frente = cachedUnidecode(line[3])
 
-row_count = 0
+        # TODO: Fix me
+        if frente == "":
+            frente = "empty"
 
-parsedDataset = {}
+        parsedDataset[frente].append(RowData(parse_date(line[0]), cachedUnidecode(line[2]), frente, unidecode(line[4].translate(conteudoTable))))
 
-for i, line in enumerate(csvreader):
+# Read the whole directory first, the key directories are created inside it
+with os.scandir(workingDirectory) as entries:
+    workingEntries = [entry for entry in entries if not entry.name.startswith('.')]
 
-    tempRow: RowData = {}
+createdDirectories = set()
 
-    tempDate= dateparser.parse(line[0], languages=['pt'])
-
-    if type(tempDate) is NoneType:
-        tempRow['date'] = line[0]
-    else:
-        tempRow['date'] = unidecode(tempDate.strftime("%m-%d"))
-
-    tempRow['disciplina'] = unidecode(line[2])
-    tempRow['frente'] = unidecode(line[3])
-    tempRow['conteudo'] = unidecode(line[4].replace("/", "-").replace(":", " -"))
-    row_count += 1
-
-    # TODO: Fix me
-    if tempRow['frente'] == "":
-        tempRow['frente'] = "empty"
-        
-    if not tempRow['frente'] in parsedDataset:
-        parsedDataset[tempRow['frente']] = []
-
-    parsedDataset[tempRow['frente']].append(tempRow)
-
-# if num_files != row_count * 2:
-#     raise Exception("Number of files in the directory and number of rows in the CSV file are not equal")
-
-directoryFileList = []
-
-expression = r"\-(.*?)\-"
-for filename in glob.glob(f"{workingDirectory}/[!.]*"):
-    match = re.search(expression, filename)
+for entry in workingEntries:
+    match = dashExpression.search(entry.name)
 
     matchItem = match.group(0).strip(" -")
 
     if matchItem == "":
         matchItem = "empty"
 
-    if not os.path.exists(f"{workingDirectory}/{matchItem}"):
-        os.mkdir(f"{workingDirectory}/{matchItem}")
-
-    os.system(f"mv '{filename}' '{workingDirectory}/{matchItem}'")
+    if not matchItem in createdDirectories:
+        os.makedirs(f"{workingDirectory}/{matchItem}", exist_ok=True)
+        createdDirectories.add(matchItem)
 
-for key in parsedDataset:
-    i = 0 
-    j = False
+    os.rename(entry.path, f"{workingDirectory}/{matchItem}/{entry.name}")
 
+# Check every file of a key, returning the report instead of printing it so keys don't interleave
+def check_key(key):
     # Sort the items in the key by date, if date is the same sort by conteudo
-    parsedDataset[key] = sorted(parsedDataset[key], key=lambda k: (k['date'], k['conteudo']))
+    rows = sorted(parsedDataset[key], key=operator.attrgetter('date', 'conteudo'))
+
+    directoryFileList = []
+
+    # No file had this key, so there is no directory to list
+    if key in createdDirectories:
+        with os.scandir(f"{workingDirectory}/{key}") as entries:
+            directoryFileList = sorted((entry for entry in entries if not entry.name.startswith('.')), key=file_sort_key)
 
-    directoryFileList = natsorted(glob.glob(f"{workingDirectory}/{key}/*"))
+    output = [f"\n\nChecking {key}..."]
 
-    print(f"\n\nChecking {key}...")
+    # Every row has an esq and a dir file
+    filePairs = (directoryFileList[n:n + 2] for n in range(0, len(directoryFileList), 2))
 
-    keyLength = len(parsedDataset[key])
+    for row, pair in zip(rows, filePairs):
+        expectedPrefix = f"{row.disciplina} - {row.frente} - {row.date} - {row.conteudo} - "
 
-    # For every file in the key directory
-    for filename in directoryFileList:
-        expression = rf"^\b({re.escape(parsedDataset[key][i]['disciplina'])})( - )({re.escape(parsedDataset[key][i]['frente'])})( - )({re.escape(parsedDataset[key][i]['date'])})( - )({re.escape(parsedDataset[key][i]['conteudo'])})( - )((esq)|(dir))\b"
+        for entry in pair:
+            output.extend(check_file(entry, expectedPrefix))
 
-        shortFilename = unidecode(os.path.basename(filename))
-        if not re.search(expression, shortFilename):
-            print(f"   Found: {shortFilename}")
-            print(f"Expected: {parsedDataset[key][i]['disciplina']} - {parsedDataset[key][i]['frente']} - {parsedDataset[key][i]['date']} - {parsedDataset[key][i]['conteudo']} - esq|dir\n")
+    return output
 
-        if j == False:
-               j = True
-        elif j == True:
-            if i == keyLength - 1:
-                break
-            i += 1
-            j = False
+# Keys are independent, check them in parallel and print the reports in order
+with ThreadPoolExecutor(max_workers=min(8, len(parsedDataset)) or 1) as executor:
+    for output in executor.map(check_key, parsedDataset):
+        print("\n".join(output))
 
-os.system(f"rm -rf '{workingDirectory}'")
\ No newline at end of file
+shutil.rmtree(workingDirectory)